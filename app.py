@@ -2,21 +2,31 @@ import gradio as gr
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-import requests
-from urllib.parse import urlparse, urljoin
+from lxml import html as lxhtml
+import aiohttp
+import cachetools
+from urllib.parse import urlparse, urljoin, urlunparse
 import os
+import copy
 import time
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
-import tempfile
-import base64
+import queue
+import threading
+import weakref
+import pybase64
 from io import BytesIO
 from PIL import Image
 import atexit
 import shutil
-from llm_analyzer import analyze_screenshots
+import tempfile
+import hashlib
+from llm_analyzer import analyze_screenshots, ERROR_DETAILS
 import json
+import re
 
 # Define viewport sizes
 VIEWPORT_SIZES = {
@@ -24,31 +34,139 @@ VIEWPORT_SIZES = {
     'mobile': (375, 812)  # iPhone X dimensions
 }
 
-# Keep track of temporary files for cleanup
-temp_files = set()
+# JPEG quality requested from Chrome when capturing screenshots
+JPEG_QUALITY = 85
+
+# Maximum seconds to wait for a page to finish loading before capturing it
+PAGE_LOAD_TIMEOUT = 10
+
+# Treat the network as idle once no new resources have loaded for this many seconds
+NETWORK_IDLE_TIME = 0.3
+
+# Most seconds spent waiting for the network to go idle once the document has loaded; pages
+# with analytics beacons or polling never go idle, so this keeps them from using the full timeout
+NETWORK_IDLE_TIMEOUT = 2
+
+# Third-party trackers and web fonts skipped in fast mode, as CDP URL patterns
+BLOCKED_URL_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*.woff2",
+    "*.woff"
+]
+
+def read_max_workers():
+    """Read GMS_MAX_WORKERS, defaulting to the CPU count up to 8 and never going below 1."""
+    value = os.environ.get('GMS_MAX_WORKERS', '').strip()
+    if not value:
+        return min(8, os.cpu_count() or 1)
+    try:
+        return max(1, int(value))
+    except ValueError:
+        raise ValueError(f"GMS_MAX_WORKERS must be an integer, got {value!r}") from None
+
+# Screenshots captured at once across both viewports, overridable with GMS_MAX_WORKERS
+MAX_CONCURRENCY = read_max_workers()
+
+# Number of pre-warmed Chrome drivers kept per viewport, enough for every capture slot
+POOL_SIZE = max(1, -(-MAX_CONCURRENCY // len(VIEWPORT_SIZES)))
+
+# Restart a pooled driver after this many screenshots to keep Chrome's memory in check
+RECYCLE_AFTER = 100
+
+# Configure WebDriver Manager environment variables
+os.environ['WDM_LOCAL'] = '1'
+os.environ['WDM_SSL_VERIFY'] = '0'
+os.environ['WDM_PATH'] = '/tmp/.wdm'
+
+# Resolve the chromedriver binary once at import instead of per driver
+CHROMEDRIVER_PATH = ChromeDriverManager().install()
+
+# Long-lived worker threads for the blocking Selenium captures
+SHOT_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix='shot')
+atexit.register(SHOT_EXECUTOR.shutdown, wait=False)
+
+# Recent results keyed by (normalized URL, return_base64, light_mode, fast_mode)
+RESULT_CACHE = cachetools.TTLCache(maxsize=64, ttl=120)
+CACHE_LOCK = threading.Lock()
+
+# Gallery images are written here once per screenshot, so Gradio serves the captured JPEG
+# as is instead of re-encoding every image on every streamed update
+GALLERY_DIR = os.path.join(tempfile.gettempdir(), 'gms_gallery')
+os.makedirs(GALLERY_DIR, exist_ok=True)
+atexit.register(shutil.rmtree, GALLERY_DIR, ignore_errors=True)
+
+# Gallery files older than this many seconds are swept when a new capture starts
+GALLERY_MAX_AGE = 3600
+
+# Captures currently running, so duplicate requests wait on the first one
+_in_flight = {}
+
+# Most bytes of a page downloaded for link discovery
+MAX_PAGE_BYTES = 2_000_000
+
+# Number of times a failed page fetch is retried, with exponential backoff
+FETCH_RETRIES = 2
+
+# Link path extensions that are pages; only links with some other extension are checked with HEAD
+PAGE_EXTENSIONS = {'', '.html', '.htm', '.xhtml', '.shtml', '.php', '.asp', '.aspx', '.jsp', '.cfm'}
+
+# Media types of HTML pages
+HTML_MEDIA_TYPES = {'text/html', 'application/xhtml+xml'}
+
+# Most HEAD checks in flight at once, so they stay well under the per-host connection limit
+MAX_HEAD_CHECKS = 4
+
+# Shared aiohttp sessions so page fetches reuse keep-alive connections.
+# A session is bound to the event loop that created it, so keep one per loop.
+_http_sessions = weakref.WeakKeyDictionary()
 
-def cleanup_temp_files():
-    """Clean up all temporary files created during the session."""
-    print("\nCleaning up temporary files...")
-    for file_path in temp_files:
+async def get_http_session():
+    """Return the aiohttp session of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, limit_per_host=10, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=10, connect=3, sock_read=10)
+        )
+        _http_sessions[loop] = session
+    return session
+
+def close_http_sessions():
+    """Close every open aiohttp session on its own event loop."""
+    for loop, session in list(_http_sessions.items()):
+        if session.closed or loop.is_closed():
+            continue
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Removed temporary file: {file_path}")
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+            else:
+                loop.run_until_complete(session.close())
         except Exception as e:
-            print(f"Error removing temporary file {file_path}: {str(e)}")
+            print(f"Error closing HTTP session: {str(e)}")
 
-# Register cleanup function to run on exit
-atexit.register(cleanup_temp_files)
+atexit.register(close_http_sessions)
 
-def setup_driver(viewport_type='desktop'):
-    """Set up and return a configured Chrome WebDriver."""
-    print(f"Setting up Chrome WebDriver for {viewport_type} view...")
+def build_chrome_options(viewport_type='desktop', light_mode=False):
+    """Build the Chrome options for a viewport and light mode setting."""
     chrome_options = Options()
-    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     
+    # Turn off browser features that screenshots never use to save memory and CPU
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-sync")
+    chrome_options.add_argument("--mute-audio")
+    chrome_options.add_argument("--disable-features=TranslateUI,BlinkGenPropertyTrees")
+    
+    # Return from driver.get at DOMContentLoaded; the readyState wait covers the rest
+    chrome_options.page_load_strategy = 'eager'
+    
     # Set viewport size
     width, height = VIEWPORT_SIZES[viewport_type]
     chrome_options.add_argument(f"--window-size={width},{height}")
@@ -61,63 +179,226 @@ def setup_driver(viewport_type='desktop'):
         }
         chrome_options.add_experimental_option("mobileEmulation", mobile_emulation)
     
-    # Configure WebDriver Manager environment variables
-    os.environ['WDM_LOCAL'] = '1'
-    os.environ['WDM_SSL_VERIFY'] = '0'
-    os.environ['WDM_PATH'] = '/tmp/.wdm'
+    # Skip image downloads when only the page structure matters
+    if light_mode:
+        chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
     
-    service = Service(ChromeDriverManager().install())
+    return chrome_options
+
+# Options templates built once at import, copied for every driver that gets started
+CHROME_OPTIONS = {
+    (viewport_type, light_mode): build_chrome_options(viewport_type, light_mode)
+    for viewport_type in VIEWPORT_SIZES
+    for light_mode in (False, True)
+}
+
+def setup_driver(viewport_type='desktop', light_mode=False):
+    """Set up and return a configured Chrome WebDriver."""
+    print(f"Setting up Chrome WebDriver for {viewport_type} view...")
+    # Deep copy so the template's argument list and experimental options stay untouched
+    chrome_options = copy.deepcopy(CHROME_OPTIONS[(viewport_type, light_mode)])
+    service = Service(CHROMEDRIVER_PATH)
 
     driver = webdriver.Chrome(service=service, options=chrome_options)
+    # Network domain must be on for per-capture URL blocking in fast mode
+    driver.execute_cdp_cmd("Network.enable", {})
     print(f"Chrome WebDriver setup complete for {viewport_type} view!")
     return driver
 
-def get_urls(url):
-    """Extract both subdomains and paths from a given URL."""
+def quit_driver(driver):
+    """Quit a WebDriver, ignoring errors from an already dead browser."""
     try:
-        print(f"\nStarting URL discovery for {url}...")
-        # Parse the main domain
-        parsed_url = urlparse(url)
-        main_domain = parsed_url.netloc
+        driver.quit()
+    except Exception as e:
+        print(f"Error quitting Chrome WebDriver: {str(e)}")
+
+class BrowserPool:
+    """Pool of Chrome WebDrivers with one queue per viewport and light mode setting."""
+
+    def __init__(self, size=POOL_SIZE):
+        keys = [(viewport_type, light_mode) for viewport_type in VIEWPORT_SIZES for light_mode in (False, True)]
+        self.queues = {key: queue.Queue() for key in keys}
+        # Light mode drivers are only started once someone asks for them
+        self.missing = {key: size if key[1] else 0 for key in keys}
+        self.uses = {}
+        self.lock = threading.Lock()
+        # Signalled whenever a driver is returned or retired, so waiters can take it or respawn it.
+        # It is shared by every viewport and mode, so all waiters are woken and recheck their own queue.
+        self.changed = threading.Condition(self.lock)
+        print(f"\nPre-warming browser pool with {size} drivers per viewport...")
+        for (viewport_type, light_mode), drivers in self.queues.items():
+            if light_mode:
+                continue
+            for _ in range(size):
+                try:
+                    drivers.put(setup_driver(viewport_type))
+                except Exception as e:
+                    print(f"Error starting {viewport_type} driver for pool: {str(e)}")
+                    self.missing[(viewport_type, light_mode)] += 1
+
+    def acquire(self, viewport_type, light_mode=False):
+        """Check out a driver for the viewport, blocking until one is free."""
+        key = (viewport_type, light_mode)
+        with self.changed:
+            while True:
+                if not self.queues[key].empty():
+                    return self.queues[key].get_nowait()
+                if self.missing[key] > 0:
+                    self.missing[key] -= 1
+                    break
+                self.changed.wait()
+        # Start a driver that was retired, failed to start or was never warmed
+        try:
+            return setup_driver(viewport_type, light_mode)
+        except Exception:
+            with self.changed:
+                self.missing[key] += 1
+                self.changed.notify_all()
+            raise
+
+    def release(self, viewport_type, driver, healthy=True, light_mode=False):
+        """Return a driver to the pool, retiring it if it failed or is due for recycling."""
+        key = (viewport_type, light_mode)
+        with self.changed:
+            uses = self.uses.pop(driver, 0) + 1
+            retire = not healthy or uses >= RECYCLE_AFTER
+            if retire:
+                # A waiting acquire will start the replacement
+                self.missing[key] += 1
+            else:
+                self.uses[driver] = uses
+                self.queues[key].put(driver)
+            self.changed.notify_all()
+        if retire:
+            print(f"Retiring {viewport_type} driver after {uses} uses")
+            quit_driver(driver)
+
+    def shutdown(self):
+        """Quit every idle driver in the pool."""
+        print("\nShutting down browser pool...")
+        for drivers in self.queues.values():
+            while True:
+                try:
+                    driver = drivers.get_nowait()
+                except queue.Empty:
+                    break
+                quit_driver(driver)
+
+# Ports that are implied by the scheme and can be dropped from a URL
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """Canonicalize a URL into a dedup key for links that differ only cosmetically."""
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    # Collapse an explicit default port, e.g. https://example.com:443
+    if parsed.port is not None and parsed.port == DEFAULT_PORTS.get(scheme):
+        netloc = netloc.rsplit(':', 1)[0]
+    # Sort the raw query parameters without re-encoding them, drop the fragment and
+    # collapse trailing slashes
+    query = '&'.join(sorted(parsed.query.split('&'))) if parsed.query else ''
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((scheme, netloc, path, parsed.params, query, ''))
+
+async def _is_html(session, url, slots):
+    """Check with a HEAD request whether a URL serves an HTML page."""
+    # Extensionless and page-like paths are kept without a request
+    if os.path.splitext(urlparse(url).path)[1].lower() in PAGE_EXTENSIONS:
+        return True
+    try:
+        async with slots, session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=3)) as response:
+            content_type = response.headers.get('Content-Type')
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        # Some servers reject HEAD, so keep the URL and let the browser decide
+        return True
+    return content_type is None or content_type.split(';')[0].strip().lower() in HTML_MEDIA_TYPES
+
+async def _fetch(url):
+    """Download the raw HTML bytes of a page."""
+    print("Fetching main page content...")
+    session = await get_http_session()
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            async with session.get(url) as response:
+                # Stop reading huge pages at MAX_PAGE_BYTES; lxml copes with the truncated tail
+                try:
+                    return await response.content.readexactly(MAX_PAGE_BYTES)
+                except asyncio.IncompleteReadError as e:
+                    return e.partial
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == FETCH_RETRIES:
+                raise
+            await asyncio.sleep(0.3 * 2 ** attempt)
+
+def _parse(html, url):
+    """Extract subdomain and path URLs of the page's base domain from its HTML, keyed by normalized URL."""
+    # Parse the main domain
+    parsed_url = urlparse(url)
+    main_domain = parsed_url.hostname or ''
+    
+    # Get the base domain (e.g., example.com from sub.example.com)
+    parts = main_domain.split('.')
+    if len(parts) > 2:
+        base_domain = '.'.join(parts[-2:])
+    else:
+        base_domain = main_domain
         
-        # Get the base domain (e.g., example.com from sub.example.com)
-        parts = main_domain.split('.')
-        if len(parts) > 2:
-            base_domain = '.'.join(parts[-2:])
-        else:
-            base_domain = main_domain
+    print(f"Base domain identified: {base_domain}")
+    
+    # Raw bytes let lxml pick the encoding from the page's own meta tags
+    doc = lxhtml.fromstring(html)
+    
+    # Find all links
+    print("Analyzing page for URLs...")
+    # Keep the first link as written for each normalized URL; the key only deduplicates,
+    # the browser is pointed at the original so servers see the query they expect
+    urls = {}
+    suffix = '.' + base_domain
+    
+    # Process the href of every anchor, selected in C by a single XPath query
+    for href in doc.xpath('//a/@href'):
+        href = href.strip()
+        # Skip in-page anchors and non-navigational schemes before resolving them
+        if href.startswith(('#', 'javascript:', 'mailto:', 'tel:')):
+            continue
+        try:
+            # Convert relative URLs to absolute
+            full_url = urljoin(url, href)
+            parsed_href = urlparse(full_url)
+            host = parsed_href.hostname
             
-        print(f"Base domain identified: {base_domain}")
-        
-        # Make a request to the main domain
-        print("Fetching main page content...")
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find all links
-        print("Analyzing page for URLs...")
-        urls = set()
+            # Add if it's a web page on the base domain or one of its subdomains
+            if parsed_href.scheme not in DEFAULT_PORTS:
+                continue
+            if host and (host == base_domain or host.endswith(suffix)):
+                urls.setdefault(normalize_url(full_url), full_url)
+        except:
+            continue
+    return urls
+
+async def get_urls(url):
+    """Extract both subdomains and paths from a given URL."""
+    try:
+        print(f"\nStarting URL discovery for {url}...")
+        html = await _fetch(url)
+        # Parse off the event loop so the Gradio queue stays responsive
+        urls = await asyncio.to_thread(_parse, html, url)
         
-        # Process all links
-        for link in soup.find_all('a'):
-            href = link.get('href')
-            if href:
-                try:
-                    # Convert relative URLs to absolute
-                    full_url = urljoin(url, href)
-                    parsed_href = urlparse(full_url)
-                    
-                    # Add if it's a subdomain or path of our base domain
-                    if parsed_href.netloc and base_domain in parsed_href.netloc:
-                        urls.add(full_url)
-                except:
-                    continue
+        # Add the main URL, as entered, in place of any link that normalizes to it
+        main_key = normalize_url(url)
+        urls[main_key] = url
         
-        # Add the main URL if it's not already included
-        urls.add(url)
+        # Drop links to binary files such as PDFs or archives
+        session = await get_http_session()
+        candidates = sorted(key for key in urls if key != main_key)
+        slots = asyncio.Semaphore(MAX_HEAD_CHECKS)
+        checks = await asyncio.gather(*[_is_html(session, urls[key], slots) for key in candidates])
+        keys = {main_key} | {key for key, is_html in zip(candidates, checks) if is_html}
         
-        # Convert to list and sort
-        url_list = sorted(list(urls))
+        # Convert to list, sorted by normalized URL
+        url_list = [urls[key] for key in sorted(keys)]
         print(f"Found {len(url_list)} URLs:")
         for found_url in url_list:
             print(f"  - {found_url}")
@@ -126,178 +407,268 @@ def get_urls(url):
         print(f"Error getting URLs: {str(e)}")
         return [url]
 
-def take_screenshot(url, viewport_type='desktop', return_base64=False):
-    """Take a screenshot of a given URL with specified viewport."""
+def wait_for_network_idle(driver, deadline):
+    """Poll the Resource Timing API until no new requests finish for NETWORK_IDLE_TIME."""
+    last_count = None
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= NETWORK_IDLE_TIME:
+            return True
+        time.sleep(0.1)
+    return False
+
+def screenshot_page(driver, url, fast_mode=False):
+    """Load a URL in an existing WebDriver and return a base64 JPEG screenshot of it."""
+    # Pooled drivers are shared between modes, so always set (or clear) the block list
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS if fast_mode else []})
+    print(f"Navigating to {url}")
+    deadline = time.monotonic() + PAGE_LOAD_TIMEOUT
+    driver.get(url)
+    print("Waiting for page to load...")
+    try:
+        WebDriverWait(driver, max(deadline - time.monotonic(), 0), poll_frequency=0.1).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        # Give late XHR, font and lazy image requests a moment to settle
+        if not wait_for_network_idle(driver, min(deadline, time.monotonic() + NETWORK_IDLE_TIMEOUT)):
+            print("Network still busy after the page loaded, capturing anyway")
+    except TimeoutException:
+        print(f"Page still loading after {PAGE_LOAD_TIMEOUT}s, capturing anyway")
+    
+    # Capture a compressed JPEG of the visible viewport straight from the DevTools protocol
+    result = driver.execute_cdp_cmd('Page.captureScreenshot', {
+        'format': 'jpeg',
+        'quality': JPEG_QUALITY,
+        'captureBeyondViewport': False,
+        'optimizeForSpeed': True
+    })
+    return result['data']
+
+def decode_screenshot(screenshot):
+    """Turn a base64 encoded screenshot into a PIL image for the gallery."""
+    return Image.open(BytesIO(pybase64.b64decode(screenshot)))
+
+def save_gallery_file(screenshot):
+    """Write a base64 encoded screenshot to the gallery directory once and return its path."""
+    path = os.path.join(GALLERY_DIR, hashlib.sha1(screenshot.encode()).hexdigest() + '.jpg')
+    if not os.path.exists(path):
+        # Write under a temporary name so a half-written file is never served
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pybase64.b64decode(screenshot))
+        os.replace(tmp_path, path)
+    else:
+        # Mark the file as in use again so a sweep doesn't remove it from under this capture
+        os.utime(path)
+    return path
+
+def sweep_gallery_dir():
+    """Delete gallery files older than GALLERY_MAX_AGE."""
+    cutoff = time.time() - GALLERY_MAX_AGE
+    for entry in os.scandir(GALLERY_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def capture_screenshot(url, viewport_type='desktop', return_base64=False, light_mode=False, fast_mode=False):
+    """Take a screenshot of a given URL with a pooled driver for the viewport (blocking)."""
     try:
         print(f"\nTaking {viewport_type} screenshot of {url}...")
-        driver = setup_driver(viewport_type)
-        print(f"Navigating to {url}")
-        driver.get(url)
-        print("Waiting for page to load...")
-        time.sleep(2)  # Wait for page to load
-        
-        # Take screenshot to memory
-        screenshot = driver.get_screenshot_as_png()
-        driver.quit()
+        driver = browser_pool.acquire(viewport_type, light_mode)
+        healthy = False
+        try:
+            screenshot = screenshot_page(driver, url, fast_mode)
+            healthy = True
+        finally:
+            browser_pool.release(viewport_type, driver, healthy, light_mode)
         
         if return_base64:
-            # Return base64 encoded image for API/MCP
-            base64_screenshot = base64.b64encode(screenshot).decode('utf-8')
-            return base64_screenshot
+            # Chrome already returns base64 encoded data, pass it through for API/MCP
+            return screenshot
         else:
-            # Save to temporary file for UI display
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                tmp.write(screenshot)
-                screenshot_path = tmp.name
-                temp_files.add(screenshot_path)  # Track for cleanup
-            return screenshot_path
+            # Hand the image to the gallery in memory, no temporary file needed
+            return decode_screenshot(screenshot)
             
     except Exception as e:
         print(f"Error taking {viewport_type} screenshot of {url}: {str(e)}")
-        if 'driver' in locals():
-            driver.quit()
         return None
 
-def process_url(url, return_base64=False):
-    """Process a URL and return screenshots of all discovered URLs."""
-    print(f"\n{'='*50}")
-    print(f"Starting process for URL: {url}")
-    print(f"{'='*50}")
-    
-    # Ensure URL has proper format
-    if not url.startswith(('http://', 'https://')):
-        url = 'https://' + url
-        print(f"Added https:// prefix to URL")
-    
+async def take_screenshot(url, viewport_type='desktop', return_base64=False, light_mode=False, fast_mode=False):
+    """Take a screenshot without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(SHOT_EXECUTOR, capture_screenshot, url, viewport_type, return_base64, light_mode, fast_mode)
+
+async def _capture_all(url, return_base64, max_concurrency, light_mode, fast_mode, progress=None):
+    """Discover the URLs of a page and screenshot each of them in both viewports."""
     # Get URLs
-    urls = get_urls(url)
+    urls = await get_urls(url)
     
-    # Take screenshots in parallel for both desktop and mobile
+    # Take screenshots in parallel, overlapping desktop and mobile captures
     desktop_screenshots = []
     mobile_screenshots = []
     
-    for viewport_type in ['desktop', 'mobile']:
-        print(f"\nStarting parallel {viewport_type} screenshot capture of {len(urls)} URLs...")
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            screenshot_paths = list(executor.map(
-                lambda url: take_screenshot(url, viewport_type, return_base64),
-                urls
-            ))
-        
-        # Filter out None values and create gallery items
-        print(f"\nProcessing {viewport_type} results...")
-        for found_url, screenshot in zip(urls, screenshot_paths):
-            if screenshot:
-                if viewport_type == 'desktop':
-                    desktop_screenshots.append((screenshot, f"URL: {found_url}"))
-                else:
-                    mobile_screenshots.append((screenshot, f"URL: {found_url}"))
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Never run more captures of a viewport than it has pooled drivers, so no executor
+    # thread sits blocked in the pool while the other viewport's drivers are idle
+    viewport_slots = {viewport_type: asyncio.Semaphore(POOL_SIZE) for viewport_type in VIEWPORT_SIZES}
+    
+    async def _capture(found_url, viewport_type):
+        async with viewport_slots[viewport_type], semaphore:
+            return found_url, viewport_type, await take_screenshot(found_url, viewport_type, return_base64, light_mode, fast_mode)
+    
+    print(f"\nStarting parallel desktop and mobile screenshot capture of {len(urls)} URLs...")
+    captures = [
+        _capture(found_url, viewport_type)
+        for found_url in urls
+        for viewport_type in ('desktop', 'mobile')
+    ]
+    
+    # Filter out None values and create gallery items as each capture finishes
+    for next_capture in asyncio.as_completed(captures):
+        found_url, viewport_type, screenshot = await next_capture
+        if screenshot:
+            if viewport_type == 'desktop':
+                desktop_screenshots.append((screenshot, f"URL: {found_url}"))
+            else:
+                mobile_screenshots.append((screenshot, f"URL: {found_url}"))
+        if progress is not None:
+            progress.put_nowait((list(desktop_screenshots), list(mobile_screenshots)))
     
     print(f"\nSuccessfully captured {len(desktop_screenshots)} desktop and {len(mobile_screenshots)} mobile screenshots")
     print(f"{'='*50}\n")
     return desktop_screenshots, mobile_screenshots
 
-def analyze_screenshots_handler(desktop_screenshots, mobile_screenshots):
-    """Handler for analyzing screenshots with LLM."""
-    print("\nStarting LLM analysis of screenshots...")
+def _finish_capture(key, task):
+    """Drop a finished capture from the in-flight table and cache its results."""
+    _in_flight.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    desktop_screenshots, mobile_screenshots = task.result()
+    # Don't cache a run where every screenshot failed
+    if desktop_screenshots or mobile_screenshots:
+        with CACHE_LOCK:
+            RESULT_CACHE[key] = (desktop_screenshots, mobile_screenshots)
+
+async def iter_screenshots(url, return_base64=False, max_concurrency=MAX_CONCURRENCY, light_mode=False, fast_mode=False):
+    """Yield the growing (desktop, mobile) screenshot lists as captures finish."""
+    print(f"\n{'='*50}")
+    print(f"Starting process for URL: {url}")
+    print(f"{'='*50}")
     
-    # Check if there are any screenshots
-    if not desktop_screenshots and not mobile_screenshots:
-        return "⚠️ No screenshots available for analysis. Please generate screenshots first."
+    # Ensure URL has proper format
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+        print(f"Added https:// prefix to URL")
     
-    all_screenshots = [s[0] for s in desktop_screenshots + mobile_screenshots]
-    analysis_results = analyze_screenshots(all_screenshots)
+    key = (normalize_url(url), return_base64, light_mode, fast_mode)
+    with CACHE_LOCK:
+        cached = RESULT_CACHE.get(key)
+    if cached is not None:
+        print("Returning cached screenshots")
+        yield cached
+        return
     
-    # Parse the analysis results into a structured format
-    try:
-        # Split the analysis into individual screenshot analyses and summary
-        parts = analysis_results.split("\n\nSUMMARY:\n")
-        individual_analyses = parts[0].strip().split("\n\n")
-        summary = parts[1] if len(parts) > 1 else ""
-        
-        # Create HTML for the analysis display
-        html_output = """
+    # Shield the shared capture so one caller going away doesn't abort it for the others
+    task = _in_flight.get(key)
+    if task is not None:
+        print("URL is already being captured, waiting for its results")
+        yield await asyncio.shield(task)
+        return
+    
+    progress = asyncio.Queue()
+    task = asyncio.ensure_future(_capture_all(url, return_base64, max_concurrency, light_mode, fast_mode, progress))
+    _in_flight[key] = task
+    task.add_done_callback(lambda done: _finish_capture(key, done))
+    
+    # Stream partial results until the capture finishes
+    while not task.done():
+        next_update = asyncio.ensure_future(progress.get())
+        await asyncio.wait({next_update, task}, return_when=asyncio.FIRST_COMPLETED)
+        if not next_update.done():
+            next_update.cancel()
+            break
+        yield next_update.result()
+    yield await asyncio.shield(task)
+
+async def process_url(url, return_base64=False, max_concurrency=MAX_CONCURRENCY, light_mode=False, fast_mode=False):
+    """Process a URL and return screenshots of all discovered URLs."""
+    screenshots = ([], [])
+    async for screenshots in iter_screenshots(url, return_base64, max_concurrency, light_mode, fast_mode):
+        pass
+    return screenshots
+
+# One screenshot analysis in the analyzer output: its number and its JSON body
+_ANALYSIS_RE = re.compile(r"Screenshot\s+(\d+)\s+Analysis:\n(\{.*?\})(?=\s*\nScreenshot\s+\d+\s+Analysis:|\s*\Z)", re.S)
+
+# Static pieces of the analysis output, built once instead of on every render
+_HEADER_HTML = """
         <div class="analysis-container">
             <div class="summary-card">
                 <h3>📊 Overall Analysis</h3>
                 <div class="summary-content">
         """
-        
-        # Add summary section
-        if summary:
-            try:
-                summary_data = json.loads(summary)
-                html_output += f"""
+
+_SUMMARY_TMPL = """
                     <div class="summary-item">
                         <h4>Summary</h4>
-                        <p>{summary_data.get('summary', 'No summary available')}</p>
+                        <p>{summary}</p>
                     </div>
                     <div class="summary-item">
                         <h4>Common Issues</h4>
                         <div class="issue-tags">
-                """
-                
-                for issue in summary_data.get('common_issues', []):
-                    html_output += f'<span class="issue-tag">{issue}</span>'
-                
-                html_output += """
+                {issues}
                         </div>
                     </div>
                     <div class="summary-item">
                         <h4>Overall Assessment</h4>
-                        <p>{}</p>
+                        <p>{assessment}</p>
                     </div>
-                """.format(summary_data.get('overall_assessment', 'No assessment available'))
-            except json.JSONDecodeError:
-                html_output += "<p>Error parsing summary data</p>"
-        
-        html_output += """
+                """
+
+_ISSUE_TAG_TMPL = '<span class="issue-tag">{}</span>'
+
+_DETAILS_HTML = """
                 </div>
             </div>
             
             <div class="screenshot-analyses">
                 <h3>🔍 Detailed Analysis</h3>
         """
-        
-        # Add individual screenshot analyses
-        for analysis in individual_analyses:
-            if "Screenshot" in analysis:
-                try:
-                    # Extract screenshot number and analysis data
-                    screenshot_num = analysis.split("Screenshot")[1].split("Analysis")[0].strip()
-                    analysis_data = json.loads(analysis.split("Analysis:\n")[1])
-                    
-                    # Determine status color
-                    status_color = "red" if analysis_data.get('issues_found', False) else "green"
-                    status_icon = "⚠️" if analysis_data.get('issues_found', False) else "✅"
-                    
-                    html_output += f"""
-                        <div class="analysis-card">
-                            <div class="analysis-header">
-                                <h4>Screenshot {screenshot_num}</h4>
-                                <span class="status-indicator" style="color: {status_color}">
-                                    {status_icon}
-                                </span>
-                            </div>
-                            <div class="analysis-content">
-                                <p>{analysis_data.get('details', 'No details available')}</p>
-                            </div>
+
+_CARD_TMPL = """
+                    <div class="analysis-card">
+                        <div class="analysis-header">
+                            <h4>Screenshot {num}</h4>
+                            <span class="status-indicator" style="color: {color}">
+                                {icon}
+                            </span>
                         </div>
-                    """
-                except json.JSONDecodeError:
-                    html_output += f"""
-                        <div class="analysis-card">
-                            <div class="analysis-header">
-                                <h4>Screenshot {screenshot_num}</h4>
-                                <span class="status-indicator">❓</span>
-                            </div>
-                            <div class="analysis-content">
-                                <p>Error parsing analysis data</p>
-                            </div>
+                        <div class="analysis-content">
+                            <p>{details}</p>
                         </div>
-                    """
-        
-        html_output += """
+                    </div>
+                """
+
+_ERROR_CARD_TMPL = """
+                    <div class="analysis-card">
+                        <div class="analysis-header">
+                            <h4>Screenshot {num}</h4>
+                            <span class="status-indicator">❓</span>
+                        </div>
+                        <div class="analysis-content">
+                            <p>Error parsing analysis data</p>
+                        </div>
+                    </div>
+                """
+
+_STYLE_HTML = """
             </div>
         </div>
         
@@ -370,13 +741,78 @@ def analyze_screenshots_handler(desktop_screenshots, mobile_screenshots):
             }
         </style>
         """
+
+def analyze_screenshots_handler(desktop_screenshots, mobile_screenshots, captured_screenshots=None):
+    """Handler for analyzing screenshots with LLM."""
+    print("\nStarting LLM analysis of screenshots...")
+    
+    # Check if there are any screenshots
+    if not desktop_screenshots and not mobile_screenshots:
+        return "⚠️ No screenshots available for analysis. Please generate screenshots first."
+    
+    if captured_screenshots:
+        # Use the captured image bytes kept in session state instead of re-reading gallery files
+        all_screenshots = [pybase64.b64decode(screenshot) for screenshot in captured_screenshots]
+    else:
+        all_screenshots = [s[0] for s in desktop_screenshots + mobile_screenshots]
+    analysis_results = analyze_screenshots(all_screenshots)
+    
+    # Parse the analysis results into a structured format
+    try:
+        # Split the analysis into individual screenshot analyses and summary
+        individual_analyses, _, summary = analysis_results.partition("\n\nSUMMARY:\n")
+        
+        # Create HTML for the analysis display
+        parts = [_HEADER_HTML]
         
-        return html_output
+        # Add summary section
+        if summary:
+            try:
+                summary_data = json.loads(summary)
+                parts.append(_SUMMARY_TMPL.format(
+                    summary=summary_data.get('summary', 'No summary available'),
+                    issues="".join(_ISSUE_TAG_TMPL.format(issue) for issue in summary_data.get('common_issues', [])),
+                    assessment=summary_data.get('overall_assessment', 'No assessment available')
+                ))
+            except json.JSONDecodeError:
+                parts.append("<p>Error parsing summary data</p>")
+        
+        parts.append(_DETAILS_HTML)
+        
+        # Add individual screenshot analyses
+        for match in _ANALYSIS_RE.finditer(individual_analyses):
+            screenshot_num = match.group(1)
+            try:
+                analysis_data = json.loads(match.group(2))
+                
+                # Determine status color; a screenshot the model couldn't analyze is unknown, not passed
+                if analysis_data.get('details') in ERROR_DETAILS:
+                    status_color, status_icon = "gray", "❓"
+                else:
+                    status_color = "red" if analysis_data.get('issues_found', False) else "green"
+                    status_icon = "⚠️" if analysis_data.get('issues_found', False) else "✅"
+                
+                parts.append(_CARD_TMPL.format(
+                    num=screenshot_num,
+                    color=status_color,
+                    icon=status_icon,
+                    details=analysis_data.get('details', 'No details available')
+                ))
+            except json.JSONDecodeError:
+                parts.append(_ERROR_CARD_TMPL.format(num=screenshot_num))
+        
+        return "".join(parts) + _STYLE_HTML
     except Exception as e:
         return f"Error formatting analysis results: {str(e)}"
 
+# Start the shared browser pool and quit its drivers on exit
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
+
 # Create Gradio interface
-with gr.Blocks(title="Website Screenshot Tool", theme=gr.themes.Soft()) as demo:
+# Gradio writes gallery images to its cache directory; sweep files older than an hour
+# every 30 minutes, and the rest when the app shuts down
+with gr.Blocks(title="Website Screenshot Tool", theme=gr.themes.Soft(), delete_cache=(1800, 3600)) as demo:
     with gr.Column(scale=1, min_width=800):
         gr.Markdown("""
 # 🌐 Website Screenshot Tool
@@ -394,6 +830,16 @@ with gr.Blocks(title="Website Screenshot Tool", theme=gr.themes.Soft()) as demo:
                 info="Make sure to include http:// or https://",
                 elem_classes=["input-field"]
             )
+            light_mode_input = gr.Checkbox(
+                label="Light Mode",
+                info="Skip loading images for faster layout-only screenshots",
+                value=False
+            )
+            fast_mode_input = gr.Checkbox(
+                label="Fast Mode",
+                info="Block analytics and web fonts so pages load sooner",
+                value=False
+            )
             submit_btn = gr.Button(
                 "Generate Screenshots",
                 variant="primary",
@@ -450,42 +896,62 @@ with gr.Blocks(title="Website Screenshot Tool", theme=gr.themes.Soft()) as demo:
                     value=" "  # Add a space to ensure minimum height
                 )
     
+    # Base64 JPEG data of the last capture, in desktop then mobile gallery order
+    captured_state = gr.State([])
+    
     # UI handlers
-    def ui_handler(url):
+    async def ui_handler(url, light_mode=False, fast_mode=False):
         if not url:
             raise gr.Error("Please enter a valid URL")
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
             print(f"Added https:// prefix to URL")
+        # Write each screenshot to a gallery file once, even though partial results repeat earlier ones
+        paths = {}
+        
+        def to_gallery(screenshots):
+            return [(paths[screenshot], caption) for screenshot, caption in screenshots]
+        
         try:
-            return process_url(url, return_base64=False)
+            await asyncio.to_thread(sweep_gallery_dir)
+            # Stream screenshots to the galleries as they are captured, keeping the
+            # encoded images in session state so the analyzer can skip the gallery files
+            async for desktop_screenshots, mobile_screenshots in iter_screenshots(url, return_base64=True, light_mode=light_mode, fast_mode=fast_mode):
+                captured = [screenshot for screenshot, _ in desktop_screenshots + mobile_screenshots]
+                new = [screenshot for screenshot in captured if screenshot not in paths]
+                if new:
+                    saved = await asyncio.to_thread(lambda: [save_gallery_file(screenshot) for screenshot in new])
+                    paths.update(zip(new, saved))
+                yield to_gallery(desktop_screenshots), to_gallery(mobile_screenshots), captured
         except Exception as e:
             raise gr.Error(f"Error processing URL: {str(e)}")
     
     # API handler
-    def api_handler(url):
+    async def api_handler(url, light_mode=False, fast_mode=False):
         if not url:
             raise gr.Error("Please enter a valid URL")
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
         try:
-            return process_url(url, return_base64=True)
+            return await process_url(url, return_base64=True, light_mode=light_mode, fast_mode=fast_mode)
         except Exception as e:
             raise gr.Error(f"Error processing URL: {str(e)}")
     
     # Register handlers
     submit_btn.click(
         fn=ui_handler,
-        inputs=url_input,
-        outputs=[desktop_gallery, mobile_gallery],
+        inputs=[url_input, light_mode_input, fast_mode_input],
+        outputs=[desktop_gallery, mobile_gallery, captured_state],
+        api_name="generate_screenshots",
         queue=True,
         concurrency_limit=1,
-        show_progress=True
+        # A full overlay would hide the screenshots streamed in so far
+        show_progress="minimal"
     )
     
     analyze_btn.click(
         fn=analyze_screenshots_handler,
-        inputs=[desktop_gallery, mobile_gallery],
+        inputs=[desktop_gallery, mobile_gallery, captured_state],
         outputs=analysis_output,
         queue=True,
         concurrency_limit=1,
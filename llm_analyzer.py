@@ -1,20 +1,168 @@
 import os
-import base64
-from openai import OpenAI
+import pybase64
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, InternalServerError
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Literal
+from typing import List, Optional, Tuple, Union, Literal
 import json
+import orjson
+import hashlib
+import mmap
+import time
+import diskcache
+import imagehash
+import asyncio
+import threading
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(
+# Most image blocks (screenshot segments) sent in one multimodal request; larger sets are
+# analyzed one call per screenshot
+MAX_IMAGES_PER_REQUEST = 8
+
+# Most per-screenshot LLM calls in flight at once when screenshots are analyzed individually
+MAX_PARALLEL_CALLS = 8
+
+# Images sent to the model are shrunk to at most this many pixels wide and sent as JPEG.
+# Limiting only the width keeps text on tall screenshots legible.
+MAX_IMAGE_WIDTH = 1024
+JPEG_QUALITY = 85
+
+# Screenshots more than half again taller than this are split into equal segments of at
+# most this many pixels high; anything shorter, like a mobile viewport, stays in one piece
+MAX_TILE_HEIGHT = 2048
+
+# Encoded segments over this size are shrunk further so one huge page can't stall the upload
+MAX_IMAGE_BYTES = 3 * 1024 * 1024
+
+# Vision model used for every analysis call
+MODEL = "google/gemma-3-27b-it"
+
+# Sampling temperature, 0 by default so repeated runs give the same answers and the
+# response cache stays meaningful; LLM_TEMPERATURE overrides it for debugging
+LLM_TEMPERATURE = float(os.environ.get("LLM_TEMPERATURE", 0.0))
+LLM_SEED = 42
+
+# Seconds a cached screenshot analysis stays valid, overridable with LLM_CACHE_TTL; 0 turns the cache off
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 24 * 60 * 60))
+
+# Screenshot analyses kept across runs, keyed by image hash, prompt and model
+_response_cache = diskcache.Cache("./.llm_cache")
+
+# Screenshots whose perceptual hashes differ in at most this many bits share an analysis,
+# overridable with LLM_PHASH_DISTANCE; a negative value turns near-duplicate reuse off
+PHASH_DISTANCE = int(os.environ.get("LLM_PHASH_DISTANCE", 4))
+
+# Downscaled data URLs of screenshot files, keyed by path and modification time
+_image_cache = diskcache.Cache("./.llm_cache/images")
+
+# Perceptual hashes of previously seen screenshots, keyed by image hash
+_phash_cache = diskcache.Cache("./.llm_cache/phash")
+
+# Most perceptual hashes kept in memory for the near-duplicate scan; the oldest go first
+MAX_PHASHES = 10_000
+
+# Instructions for analyzing a single screenshot. The system prompts are kept byte-identical
+# across calls so the provider can reuse its cached prefix instead of reprocessing them.
+STYLING_SYSTEM_PROMPT = """Please analyze these website screenshots for any serious styling issues. 
+    Focus only on identifying clear, objective styling problems such as:
+    - Text that is completely unreadable
+    - Elements that are severely misaligned
+    - Content that is completely cut off
+    - Major layout breaks
+    - Critical accessibility issues
+    
+    Do not make subjective judgments about design preferences or potential improvements.
+    Simply identify if there are any serious styling problems that would affect usability.
+    
+    Format your response as:
+    ISSUES_FOUND: [true/false]
+    DETAILS: [Brief description of any issues found, or "No serious styling issues found"]
+    """
+
+# Instructions for analyzing every screenshot and summarizing them in one request
+BATCH_SYSTEM_PROMPT = """Please analyze these website screenshots for any serious styling issues. 
+    Focus only on identifying clear, objective styling problems such as:
+    - Text that is completely unreadable
+    - Elements that are severely misaligned
+    - Content that is completely cut off
+    - Major layout breaks
+    - Critical accessibility issues
+    
+    Do not make subjective judgments about design preferences or potential improvements.
+    Simply identify if there are any serious styling problems that would affect usability.
+    Then summarize the findings, focusing on patterns or issues common to several screenshots.
+    
+    Respond with a single JSON object of the form:
+    {"analyses": [{"index": <screenshot number>, "issues_found": <true/false>, "details": "<brief description of any issues found, or No serious styling issues found>"}],
+     "summary": "<brief summary of findings across all screenshots>",
+     "common_issues": ["<issue that appears in multiple screenshots>"],
+     "overall_assessment": "<overall assessment of the website's styling>"}
+    Include exactly one entry in "analyses" for every screenshot.
+    """
+
+# Summary request for the per-screenshot path; the individual analyses go between head and tail
+SUMMARY_SYSTEM_PROMPT = "You are a web design analysis assistant that provides clear summaries of styling issues."
+SUMMARY_HEAD = """Please provide a summary of the following screenshot analyses. 
+    Focus on identifying any patterns or common issues across the screenshots.
+    
+    Here are the individual analyses:
+    """
+SUMMARY_TAIL = """
+    
+    Format your response as:
+    SUMMARY: [Brief summary of findings across all screenshots]
+    COMMON_ISSUES: [List any issues that appear in multiple screenshots]
+    OVERALL_ASSESSMENT: [Overall assessment of the website's styling]
+    """
+
+# Initialize OpenAI client on one long-lived pooled HTTP client. HTTP/2 lets the
+# concurrent per-screenshot calls share a single TLS connection.
+aclient = AsyncOpenAI(
     base_url="https://api.studio.nebius.com/v1/",
-    api_key=os.environ.get("NEBIUS_API_KEY")
+    api_key=os.environ.get("NEBIUS_API_KEY"),
+    # call_llm does the retrying, with jittered backoff
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+        http2=True
+    )
 )
 
+# All LLM calls run on this background event loop. The async client's connection
+# pool belongs to the loop it first ran on, so it must not move between loops.
+_loop = asyncio.new_event_loop()
+_loop_thread = threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True)
+_loop_thread.start()
+
+# Caps the per-screenshot calls in flight; only ever awaited on _loop
+_call_slots = asyncio.Semaphore(MAX_PARALLEL_CALLS)
+
+def run_async(coro):
+    """Run a coroutine on the analyzer's event loop and block until it finishes."""
+    # Unlike asyncio.run this also works from a thread that already has a running loop,
+    # such as one of Gradio's async handlers, because the coroutine runs on _loop instead
+    if threading.current_thread() is _loop_thread:
+        # Blocking here would wait on the very loop that has to finish the work
+        coro.close()
+        raise RuntimeError("run_async cannot be called from the analyzer's own event loop")
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+# Worker threads for hashing, decoding and re-encoding images; Pillow and hashlib
+# release the GIL, so this work overlaps with requests already in flight
+_ENCODE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="encode")
+
+async def run_in_pool(func, *args):
+    """Run blocking image work on the encode pool without stalling the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_ENCODE_POOL, func, *args)
+
 class ImageUrl(BaseModel):
     url: str
 
@@ -34,44 +182,60 @@ class LLMResponse(BaseModel):
     issues_found: bool = Field(..., description="Whether any styling issues were found")
     details: str = Field(..., description="Description of any issues found or confirmation of no issues")
 
+class ScreenshotAnalysis(LLMResponse):
+    index: int = Field(..., description="1-based number of the screenshot this analysis belongs to")
+
+class BatchAnalysis(BaseModel):
+    analyses: List[ScreenshotAnalysis] = Field(default_factory=list, description="One analysis per screenshot")
+    summary: str = Field(..., description="Brief summary of findings across all screenshots")
+    common_issues: List[str] = Field(default_factory=list, description="List of issues that appear in multiple screenshots")
+    overall_assessment: str = Field(..., description="Overall assessment of the website's styling")
+
 class AnalysisSummary(BaseModel):
     summary: str = Field(..., description="Brief summary of findings across all screenshots")
     common_issues: List[str] = Field(default_factory=list, description="List of issues that appear in multiple screenshots")
     overall_assessment: str = Field(..., description="Overall assessment of the website's styling")
     all_passed: bool = Field(..., description="True if all screenshots passed, False if any failed")
 
+# Details of placeholder analyses for screenshots the model gave no usable answer for
+PARSE_ERROR_DETAILS = "Error parsing response"
+CALL_ERROR_DETAILS = "Error analyzing screenshot"
+ERROR_DETAILS = {PARSE_ERROR_DETAILS, CALL_ERROR_DETAILS}
+
+def is_error(analysis: LLMResponse) -> bool:
+    """Return whether an analysis is an error placeholder rather than a real verdict."""
+    return analysis.details in ERROR_DETAILS
+
+def parse_fields(text: str, tags: Tuple[str, ...]) -> dict:
+    """Collect the value after the first line starting with each "TAG:" in a single pass."""
+    fields = {}
+    for line in text.splitlines():
+        tag, sep, value = line.partition(':')
+        if sep and tag in tags and tag not in fields:
+            fields[tag] = value.strip()
+    return fields
+
 def parse_llm_response(text: str) -> LLMResponse:
     """Parse the LLM response text into a structured format."""
     try:
-        # Extract the boolean value
-        issues_found_line = next(line for line in text.split('\n') if line.startswith('ISSUES_FOUND:'))
-        issues_found = issues_found_line.split(':', 1)[1].strip().lower() == 'true'
-        
-        # Extract the details
-        details_line = next(line for line in text.split('\n') if line.startswith('DETAILS:'))
-        details = details_line.split(':', 1)[1].strip()
-        
-        return LLMResponse(issues_found=issues_found, details=details)
+        fields = parse_fields(text, ('ISSUES_FOUND', 'DETAILS'))
+        # The fields are already a bool and plain strings, so skip pydantic validation
+        return LLMResponse.model_construct(
+            issues_found=fields['ISSUES_FOUND'].lower() == 'true',
+            details=fields['DETAILS']
+        )
     except Exception as e:
         print(f"Error parsing LLM response: {str(e)}")
-        return LLMResponse(issues_found=False, details="Error parsing response")
+        return LLMResponse(issues_found=False, details=PARSE_ERROR_DETAILS)
 
 def parse_summary_response(text: str, all_passed: bool) -> AnalysisSummary:
     """Parse the summary response text into a structured format."""
     try:
-        lines = text.split('\n')
-        summary = next(line.split(':', 1)[1].strip() for line in lines if line.startswith('SUMMARY:'))
-        
-        common_issues_line = next(line for line in lines if line.startswith('COMMON_ISSUES:'))
-        common_issues = [issue.strip() for issue in common_issues_line.split(':', 1)[1].strip().split(',') if issue.strip()]
-        
-        overall_line = next(line for line in lines if line.startswith('OVERALL_ASSESSMENT:'))
-        overall_assessment = overall_line.split(':', 1)[1].strip()
-        
-        return AnalysisSummary(
-            summary=summary,
-            common_issues=common_issues,
-            overall_assessment=overall_assessment,
+        fields = parse_fields(text, ('SUMMARY', 'COMMON_ISSUES', 'OVERALL_ASSESSMENT'))
+        return AnalysisSummary.model_construct(
+            summary=fields['SUMMARY'],
+            common_issues=[issue.strip() for issue in fields['COMMON_ISSUES'].split(',') if issue.strip()],
+            overall_assessment=fields['OVERALL_ASSESSMENT'],
             all_passed=all_passed
         )
     except Exception as e:
@@ -83,109 +247,389 @@ def parse_summary_response(text: str, all_passed: bool) -> AnalysisSummary:
             all_passed=all_passed
         )
 
-def analyze_screenshots(screenshots: List[str]) -> str:
+# A screenshot is either the path of an image file or the encoded image bytes themselves
+Screenshot = Union[str, bytes]
+
+def dump_json(model: BaseModel) -> str:
+    """Return a model as indented JSON, serialized with orjson."""
+    return orjson.dumps(model.model_dump(), option=orjson.OPT_INDENT_2).decode()
+
+def format_analyses(analyses: List[LLMResponse]) -> str:
+    """Render numbered screenshot analyses as the text shared by the summary prompt and the report."""
+    return "\n".join(
+        f"Screenshot {i} Analysis:\n{dump_json(analysis)}\n"
+        for i, analysis in enumerate(analyses, 1)
+    )
+
+def describe_screenshot(screenshot: Screenshot) -> str:
+    """Return a short printable label for a screenshot."""
+    return screenshot if isinstance(screenshot, str) else f"<{len(screenshot)} bytes in memory>"
+
+def encode_jpeg(img: Image.Image) -> str:
+    """Return an image as a base64 JPEG data URL, shrinking it until it fits MAX_IMAGE_BYTES."""
+    buf = BytesIO()
+    img.save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    scale = 1.0
+    while buf.tell() > MAX_IMAGE_BYTES and scale > 0.25:
+        scale *= 0.8
+        buf = BytesIO()
+        img.resize((int(img.width * scale), int(img.height * scale))).save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    print(f"INFO: Encoded image segment as {buf.tell() // 1024} KB JPEG")
+    # Encode straight from the buffer's memory, without a bytes copy or a separate decode
+    return "data:image/jpeg;base64," + pybase64.b64encode_as_string(buf.getbuffer())
+
+def segment_count(height: int) -> int:
+    """Return how many equal segments a downscaled image of this height is sent as."""
+    if height <= MAX_TILE_HEIGHT * 3 // 2:
+        return 1
+    return -(-height // MAX_TILE_HEIGHT)
+
+def image_segments(screenshot: Screenshot) -> int:
+    """Return how many image blocks a screenshot is sent as, reading only its header."""
+    img = Image.open(screenshot if isinstance(screenshot, str) else BytesIO(screenshot))
+    height = img.height if img.width <= MAX_IMAGE_WIDTH else round(img.height * MAX_IMAGE_WIDTH / img.width)
+    return segment_count(height)
+
+def encode_image(screenshot: Screenshot) -> List[str]:
+    """Return a screenshot downscaled and re-encoded as base64 JPEG data URLs, one per segment."""
+    # Let Pillow stream files itself rather than reading them into memory first
+    img = Image.open(screenshot if isinstance(screenshot, str) else BytesIO(screenshot))
+    img.thumbnail((MAX_IMAGE_WIDTH, img.height))
+    img = img.convert('RGB')
+    step = -(-img.height // segment_count(img.height))
+    return [
+        encode_jpeg(img.crop((0, top, img.width, min(top + step, img.height))))
+        for top in range(0, img.height, step)
+    ]
+
+def image_data_urls(screenshot: Screenshot) -> List[str]:
+    """Return the data URLs of a screenshot, reusing an earlier encoding of an unchanged file."""
+    if not isinstance(screenshot, str) or LLM_CACHE_TTL <= 0:
+        return encode_image(screenshot)
+    key = ("segments", screenshot, os.stat(screenshot).st_mtime_ns)
+    data_urls = _image_cache.get(key)
+    if data_urls is None:
+        data_urls = encode_image(screenshot)
+        _image_cache.set(key, data_urls, expire=LLM_CACHE_TTL)
+    return data_urls
+
+def image_content(data_urls: List[str]) -> List[dict]:
+    """Return the image content items of a screenshot's segments, top to bottom."""
+    return [{"type": "image_url", "image_url": {"url": data_url}} for data_url in data_urls]
+
+def image_key(screenshot: Screenshot) -> str:
+    """Return the content hash of a screenshot, which keys its cached analyses and perceptual hash."""
+    if isinstance(screenshot, str):
+        # Hash the file through a read-only memory map instead of copying it into a bytes object
+        with open(screenshot, 'rb') as img_file, mmap.mmap(img_file.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+            digest = hashlib.sha256(raw)
+    else:
+        digest = hashlib.sha256(screenshot)
+    return digest.hexdigest()
+
+def cache_key(key: str, prompt: str) -> str:
+    """Return the response cache key of an analysis produced with the given system prompt and the current model."""
+    digest = hashlib.sha256(key.encode())
+    digest.update(prompt.encode())
+    digest.update(MODEL.encode())
+    return digest.hexdigest()
+
+def perceptual_hash(screenshot: Screenshot) -> imagehash.ImageHash:
+    """Return the 64-bit perceptual hash of a screenshot."""
+    return imagehash.phash(Image.open(screenshot if isinstance(screenshot, str) else BytesIO(screenshot)))
+
+def load_phashes() -> dict:
+    """Load the unexpired perceptual hashes and their expiry times from disk, keyed by image hash."""
+    phashes = {}
+    for key in _phash_cache:
+        value, expire_time = _phash_cache.get(key, expire_time=True)
+        if value is not None:
+            phashes[key] = (imagehash.hex_to_hash(value), expire_time)
+    return phashes
+
+# In-memory copy of the perceptual hashes for the near-duplicate scan, keyed by image hash.
+# The scan runs on _ENCODE_POOL threads, so every access holds _phash_lock.
+_phashes = load_phashes()
+_phash_lock = threading.Lock()
+
+def remember_phash(key: str, phash: imagehash.ImageHash) -> None:
+    """Record a screenshot's perceptual hash, dropping expired and excess entries; the caller holds _phash_lock."""
+    now = time.time()
+    for expired in [other_key for other_key, (_, expire_time) in _phashes.items() if expire_time is not None and expire_time <= now]:
+        del _phashes[expired]
+    _phashes.pop(key, None)
+    _phashes[key] = (phash, now + LLM_CACHE_TTL)
+    while len(_phashes) > MAX_PHASHES:
+        del _phashes[next(iter(_phashes))]
+    _phash_cache.set(key, str(phash), expire=LLM_CACHE_TTL)
+
+def get_cached_analysis(key: str) -> Optional[LLMResponse]:
+    """Return the cached analysis of a screenshot from either the single or the batch prompt, or None on a miss."""
+    if LLM_CACHE_TTL <= 0:
+        return None
+    for prompt in (STYLING_SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT):
+        analysis = _response_cache.get(cache_key(key, prompt))
+        if analysis is not None:
+            return analysis
+    return None
+
+def store_analysis(key: str, analysis: LLMResponse, prompt: str) -> None:
+    """Cache the analysis of a screenshot under the system prompt that produced it for LLM_CACHE_TTL seconds."""
+    if LLM_CACHE_TTL > 0:
+        _response_cache.set(cache_key(key, prompt), analysis, expire=LLM_CACHE_TTL)
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(min=1, max=30),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    reraise=True
+)
+async def call_llm(messages: list, max_tokens: int = 512, **kwargs):
+    """Send a chat completion request, retrying rate limits and transient server or network errors."""
+    return await aclient.chat.completions.create(
+        model=MODEL,
+        max_tokens=max_tokens,
+        temperature=LLM_TEMPERATURE,
+        top_p=1.0,
+        seed=LLM_SEED,
+        messages=messages,
+        **kwargs
+    )
+
+def log_usage(label: str, response) -> None:
+    """Print the prompt tokens of a response and how many were served from the provider's prompt cache."""
+    usage = response.usage
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) if details else None) or 0
+    print(f"INFO: {label} used {usage.prompt_tokens} prompt tokens, {cached} cached")
+
+def find_near_duplicate(screenshot: Screenshot, key: str) -> Optional[LLMResponse]:
+    """Return the cached analysis of a near-identical earlier screenshot, or remember this one's perceptual hash."""
+    phash = perceptual_hash(screenshot)
+    with _phash_lock:
+        candidates = [other_key for other_key, (other_phash, _) in _phashes.items() if phash - other_phash <= PHASH_DISTANCE]
+    for other_key in candidates:
+        analysis = get_cached_analysis(other_key)
+        if analysis is not None:
+            return analysis
+    # Only screenshots that will get their own analysis are worth matching against later
+    with _phash_lock:
+        remember_phash(key, phash)
+    return None
+
+async def reuse_near_duplicates(screenshots: List[Screenshot], keys: List[str]) -> dict:
+    """Return the analyses of near-identical earlier screenshots for this run, keyed by the image hash of each screenshot without one."""
+    misses = [(screenshot, key) for screenshot, key in zip(screenshots, keys) if get_cached_analysis(key) is None]
+    # A match is only used for this run and never cached under the new image's key, so a false match doesn't persist
+    analyses = await asyncio.gather(*(run_in_pool(find_near_duplicate, screenshot, key) for screenshot, key in misses))
+    reused = {}
+    for (screenshot, key), analysis in zip(misses, analyses):
+        if analysis is not None:
+            print(f"Reusing analysis of a near-identical screenshot for {describe_screenshot(screenshot)}")
+            reused[key] = analysis
+    return reused
+
+async def analyze_batch(screenshots: List[Screenshot], keys: List[str]) -> Tuple[str, AnalysisSummary]:
+    """Analyze all screenshots and summarize them in a single multimodal LLM request."""
+    
+    # Re-encode the images off the event loop, all at once
+    segments = await asyncio.gather(*(run_in_pool(image_data_urls, screenshot) for screenshot in screenshots))
+    
+    # Interleave a numbered label with each image so the model can refer back to it
+    content = []
+    for i, (screenshot, data_urls) in enumerate(zip(screenshots, segments), 1):
+        print(f'INFO: Processing screenshot {i} --> {describe_screenshot(screenshot)}')
+        content.append({"type": "text", "text": f"Screenshot {i}:"})
+        content.extend(image_content(data_urls))
+    # Close with the task so the model answers for every image rather than trailing off after the last one
+    content.append({
+        "type": "text",
+        "text": f"Now return the JSON object with one analysis for each of these {len(screenshots)} screenshots, followed by the summary."
+    })
+    
+    messages = [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+    
+    response = await call_llm(
+        messages,
+        max_tokens=512 * (len(screenshots) + 1),
+        response_format={"type": "json_object"}
+    )
+    
+    log_usage("Batch analysis", response)
+    batch = BatchAnalysis.model_validate_json(response.choices[0].message.content)
+    by_index = {analysis.index: analysis for analysis in batch.analyses}
+    # Everything below comes from the validated batch, so build the results without revalidating
+    analyses = []
+    for i, key in enumerate(keys, 1):
+        if i in by_index:
+            analyses.append(LLMResponse.model_construct(**by_index[i].model_dump(exclude={"index"})))
+            store_analysis(key, analyses[-1], BATCH_SYSTEM_PROMPT)
+        else:
+            analyses.append(None)
+    
+    # The model skipped or misnumbered some screenshots; analyze those on their own
+    missing = [i for i, analysis in enumerate(analyses, 1) if analysis is None]
+    if missing:
+        print(f"Batch analysis left out screenshots {missing}, analyzing them individually")
+        results = await asyncio.gather(
+            *(analyze_one(i, screenshots[i - 1], keys[i - 1]) for i in missing),
+            return_exceptions=True
+        )
+        for i, result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"Error analyzing screenshot {i}: {str(result)}")
+                result = LLMResponse(issues_found=False, details=CALL_ERROR_DETAILS)
+            analyses[i - 1] = result
+    if all(is_error(analysis) for analysis in analyses):
+        raise RuntimeError("No screenshot could be analyzed")
+    
+    # issues_found marks a failure, and a screenshot that couldn't be analyzed hasn't passed either
+    all_passed = not any(analysis.issues_found or is_error(analysis) for analysis in analyses)
+    summary = AnalysisSummary.model_construct(
+        summary=batch.summary,
+        common_issues=batch.common_issues,
+        overall_assessment=batch.overall_assessment,
+        all_passed=all_passed
+    )
+    return format_analyses(analyses), summary
+
+async def analyze_one(i: int, screenshot: Screenshot, key: str, reused: Optional[dict] = None) -> LLMResponse:
+    """Analyze a single screenshot with its own LLM call, reusing a near-duplicate's or a cached analysis if there is one."""
+    analysis = reused.get(key) if reused else None
+    if analysis is None:
+        analysis = get_cached_analysis(key)
+    if analysis is not None:
+        print(f"Using cached analysis for screenshot {i}")
+        return analysis
+    
+    print(f"\nAnalyzing screenshot {i}...")
+    
+    # Add screenshot to the messages
+    print(f'INFO: Processing screenshot {i} --> {describe_screenshot(screenshot)}')
+    data_urls = await run_in_pool(image_data_urls, screenshot)
+    
+    # Create message with image
+    messages = [
+        {"role": "system", "content": STYLING_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": "Analyze this screenshot:"}] + image_content(data_urls)
+        }
+    ]
+    
+    # Make the API call for this screenshot
+    async with _call_slots:
+        response = await call_llm(messages)
+    
+    log_usage(f"Screenshot {i} analysis", response)
+    
+    # Parse the response, caching it unless it couldn't be parsed
+    analysis = parse_llm_response(response.choices[0].message.content)
+    if not is_error(analysis):
+        store_analysis(key, analysis, STYLING_SYSTEM_PROMPT)
+    return analysis
+
+async def analyze_individually(screenshots: List[Screenshot], keys: List[str], reused: dict) -> Tuple[str, AnalysisSummary]:
+    """Analyze screenshots one LLM call each, then summarize them in a follow-up call."""
+    # The calls are network-bound, so fire them all at once; gather keeps screenshot order
+    print(f"\nAnalyzing {len(screenshots)} screenshots concurrently...")
+    results = await asyncio.gather(
+        *(analyze_one(i, screenshot, key, reused) for i, (screenshot, key) in enumerate(zip(screenshots, keys), 1)),
+        return_exceptions=True
+    )
+    
+    # One failed call shouldn't throw away the analyses that did come back
+    analyses = []
+    for i, result in enumerate(results, 1):
+        if isinstance(result, Exception):
+            print(f"Error analyzing screenshot {i}: {str(result)}")
+            result = LLMResponse(issues_found=False, details=CALL_ERROR_DETAILS)
+        analyses.append(result)
+    
+    # Render the analyses once; the same text goes into the summary prompt and the final report
+    analyses_text = format_analyses(analyses)
+    
+    # Errored screenshots were never checked, so they count neither as passed nor as failed
+    errored = [analysis for analysis in analyses if is_error(analysis)]
+    if len(errored) == len(analyses):
+        raise RuntimeError("No screenshot could be analyzed")
+    
+    # Nothing to summarize across screenshots unless several were analyzed and one has issues
+    failed = [analysis for analysis in analyses if analysis.issues_found]
+    if not failed and errored:
+        return analyses_text, AnalysisSummary(
+            summary="No issues detected in the screenshots that could be analyzed.",
+            common_issues=[],
+            overall_assessment=f"{len(errored)} of {len(analyses)} screenshots could not be analyzed.",
+            all_passed=False
+        )
+    if not failed:
+        return analyses_text, AnalysisSummary(
+            summary="No issues detected in any screenshot.",
+            common_issues=[],
+            overall_assessment="All screenshots passed styling checks.",
+            all_passed=True
+        )
+    if len(analyses) == 1:
+        return analyses_text, AnalysisSummary(
+            summary=failed[0].details,
+            common_issues=[],
+            overall_assessment="The screenshot has styling issues.",
+            all_passed=False
+        )
+    
+    # Generate summary of all analyses
+    summary_prompt = SUMMARY_HEAD + analyses_text + SUMMARY_TAIL
+    
+    summary_messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": summary_prompt}
+    ]
+    
+    summary_response = await call_llm(summary_messages)
+    
+    # Parse the summary response
+    summary = parse_summary_response(summary_response.choices[0].message.content, all_passed=False)
+    return analyses_text, summary
+
+async def _analyze_async(screenshots: List[Screenshot]) -> Tuple[str, AnalysisSummary]:
+    """Analyze screenshots in one batch request, falling back to one call per screenshot."""
+    keys = await asyncio.gather(*(run_in_pool(image_key, screenshot) for screenshot in screenshots))
+    reused = {}
+    if LLM_CACHE_TTL > 0 and PHASH_DISTANCE >= 0:
+        try:
+            reused = await reuse_near_duplicates(screenshots, keys)
+        except Exception as e:
+            print(f"Near-duplicate lookup failed: {str(e)}")
+    
+    # The batch request sends every image, so it only pays off when nothing is cached or reused;
+    # otherwise the individual path analyzes just the misses and at most has to make the summary call
+    cached = sum(key in reused or get_cached_analysis(key) is not None for key in keys)
+    if cached:
+        print(f"{cached} of {len(keys)} screenshot analyses found in cache or reused")
+    elif len(screenshots) <= MAX_IMAGES_PER_REQUEST and sum(
+        await asyncio.gather(*(run_in_pool(image_segments, screenshot) for screenshot in screenshots))
+    ) <= MAX_IMAGES_PER_REQUEST:
+        try:
+            return await analyze_batch(screenshots, keys)
+        except Exception as e:
+            print(f"Batch analysis failed, analyzing screenshots individually: {str(e)}")
+    return await analyze_individually(screenshots, keys, reused)
+
+def analyze_screenshots(screenshots: List[Screenshot]) -> str:
     """Analyze screenshots for styling issues using LLM."""
     try:
         print("\nAnalyzing screenshots for styling issues...")
         
-        # Prepare the prompt
-        prompt = """Please analyze these website screenshots for any serious styling issues. 
-        Focus only on identifying clear, objective styling problems such as:
-        - Text that is completely unreadable
-        - Elements that are severely misaligned
-        - Content that is completely cut off
-        - Major layout breaks
-        - Critical accessibility issues
-        
-        Do not make subjective judgments about design preferences or potential improvements.
-        Simply identify if there are any serious styling problems that would affect usability.
-        
-        Format your response as:
-        ISSUES_FOUND: [true/false]
-        DETAILS: [Brief description of any issues found, or "No serious styling issues found"]
-        """
-        
-        individual_analyses = []
-        issues_found_list = []
-        
-        # Analyze each screenshot
-        for i, screenshot in enumerate(screenshots, 1):
-            print(f"\nAnalyzing screenshot {i} of {len(screenshots)}...")
-            
-            # Add screenshot to the messages
-            print(f'INFO: Processing screenshot {i} --> {screenshot}')
-            with open(screenshot, 'rb') as img_file:
-                base64_image = base64.b64encode(img_file.read()).decode('utf-8')
-            
-            # Create message with image
-            messages = [
-                {"role": "system", "content": prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"Analyze screenshot {i}:"},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            # Make the API call for this screenshot
-            response = client.chat.completions.create(
-                model="google/gemma-3-27b-it",
-                max_tokens=512,
-                temperature=0.5,
-                top_p=0.9,
-                extra_body={
-                    "top_k": 50
-                },
-                messages=messages
-            )
-            
-            # Parse the response
-            analysis = parse_llm_response(response.choices[0].message.content)
-            individual_analyses.append(f"Screenshot {i} Analysis:\n{analysis.model_dump_json(indent=2)}\n")
-            issues_found_list.append(analysis.issues_found)
-        
-        # Generate summary of all analyses
-        summary_prompt = f"""Please provide a summary of the following screenshot analyses. 
-        Focus on identifying any patterns or common issues across the screenshots.
-        
-        Here are the individual analyses:
-        {'\n'.join(individual_analyses)}
-        
-        Format your response as:
-        SUMMARY: [Brief summary of findings across all screenshots]
-        COMMON_ISSUES: [List any issues that appear in multiple screenshots]
-        OVERALL_ASSESSMENT: [Overall assessment of the website's styling]
-        """
-        
-        summary_messages = [
-            {"role": "system", "content": "You are a web design analysis assistant that provides clear summaries of styling issues."},
-            {"role": "user", "content": summary_prompt}
-        ]
-        
-        summary_response = client.chat.completions.create(
-            model="google/gemma-3-27b-it",
-            max_tokens=512,
-            temperature=0.5,
-            top_p=0.9,
-            extra_body={
-                "top_k": 50
-            },
-            messages=summary_messages
-        )
-        
-        # Parse the summary response
-        all_passed = all(issues_found_list)
-        summary = parse_summary_response(summary_response.choices[0].message.content, all_passed)
+        analyses_text, summary = run_async(_analyze_async(screenshots))
         
         # Combine individual analyses and summary
-        final_response = "\n".join(individual_analyses) + "\n\nSUMMARY:\n" + summary.model_dump_json(indent=2)
+        final_response = analyses_text + "\n\nSUMMARY:\n" + dump_json(summary)
         
         print("Analysis complete!")
         return final_response
@@ -193,4 +637,3 @@ def analyze_screenshots(screenshots: List[str]) -> str:
     except Exception as e:
         print(f"Error analyzing screenshots: {str(e)}")
         return "Error: Could not analyze screenshots" 
-        
\ No newline at end of file